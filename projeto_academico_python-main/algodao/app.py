@@ -5,10 +5,6 @@ import numpy as np
 from dataset import df, df_rec_mensal
 from utils import format_number
 from graficos import GraficoVendas, grafico_re_venda_por_dia
-from previsoes import (
-    previsao_lstm, previsao_mlp, previsao_reg_linear,
-    rmse_lstm_reais, rmse_mlp_reais, rmse_lr_reais
-)
 
 # Configuração inicial da página
 st.set_page_config(
@@ -17,9 +13,63 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_predictors(data_bytes: bytes):
+    """
+    Treina ou carrega os modelos uma única vez por servidor.
+
+    Os bytes da série de preços servem de chave do cache: enquanto os dados
+    não mudam, todas as sessões reutilizam os mesmos modelos.
+    """
+    from previsoes import carregar_modelos
+    dados = np.frombuffer(data_bytes, dtype=np.float64).reshape(-1, 1)
+    return carregar_modelos(dados)
+
+@st.cache_data
+def resumo(_df):
+    """
+    Receita total, número de vendas e linhas de preço máximo e mínimo.
+
+    O df não muda durante a execução do servidor, por isso não entra na chave
+    do cache (prefixo _) e as reduções rodam uma única vez.
+    """
+    precos = _df['Preco_R$'].to_numpy(dtype=np.float64)
+    return precos.sum(), len(precos), _df.iloc[precos.argmax()], _df.iloc[precos.argmin()]
+
 # Título principal
 st.title("Dashboard de Análise de Vendas :shopping_trolley:")
 
+@st.cache_data
+def sorted_df(_df):
+    """
+    Dados ordenados da venda mais recente para a mais antiga.
+    """
+    return _df.sort_values('Data', ascending=False)
+
+@st.cache_data
+def bar_fig(erros, modelos):
+    """
+    Gráfico de barras com o RMSE de cada modelo.
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=modelos,
+        y=erros,
+        text=[f'R${erro:.2f}' for erro in erros],
+        textposition='auto',
+        marker_color=['#636EFA', '#EF553B', '#00CC96']
+    ))
+    
+    fig.update_layout(
+        title='Erro Médio (RMSE) em Reais',
+        xaxis_title='Modelos',
+        yaxis_title='Erro Médio (R$)',
+        template='plotly_white'
+    )
+    return fig
+
+receita_total, total_vendas, preco_max, preco_min = resumo(df)
+
 # Criando as abas
 aba1, aba2, aba3, aba4, aba5 = st.tabs([
     "📊 Visualização de Dados",
@@ -32,7 +82,7 @@ aba1, aba2, aba3, aba4, aba5 = st.tabs([
 # Aba 1 - Visualização de dados
 with aba1:
     st.header("Dados Completos de Vendas")
-    st.dataframe(df.sort_values('Data', ascending=False), height=500)
+    st.dataframe(sorted_df(df), height=500)
     
     with st.expander("🔍 Sobre os dados"):
         st.markdown("""
@@ -49,11 +99,11 @@ with aba2:
     with col1:
         st.metric(
             label="Receita Total", 
-            value=format_number(df['Preco_R$'].sum(), 'R$'))
+            value=format_number(receita_total, 'R$'))
     with col2:
         st.metric(
             label="Total de Vendas", 
-            value=format_number(df.shape[0]))
+            value=format_number(total_vendas))
     
     # Gráfico de receita mensal
     grafico_vendas = GraficoVendas(df_rec_mensal)
@@ -64,9 +114,6 @@ with aba2:
 with aba3:
     st.header("Análise Histórica de Preços")
     
-    preco_max = df.loc[df['Preco_R$'].idxmax()]
-    preco_min = df.loc[df['Preco_R$'].idxmin()]
-    
     col1, col2 = st.columns(2)
     with col1:
         st.metric(
@@ -96,6 +143,16 @@ with aba3:
 with aba4:
     st.header("Previsões de Preço com Inteligência Artificial")
     
+    # Import tardio: o Streamlit executa todas as abas a cada execução, então o
+    # TensorFlow sempre é carregado, mas só depois que as abas 1 a 3 já foram
+    # desenhadas
+    from previsoes import previsao_lstm, previsao_mlp, previsao_reg_linear
+    
+    # Modelos de previsão (treinados uma vez e lidos do cache nas próximas execuções)
+    # A coluna de preços vem do JSON como object; converte para float antes de gerar a chave
+    preditores = get_predictors(df['Preco_R$'].to_numpy(dtype=np.float64).tobytes())
+    rmse_lstm_reais, rmse_mlp_reais, rmse_lr_reais = preditores['rmse']
+    
     st.info("""
     Os modelos abaixo foram treinados para prever o próximo preço do algodão
     com base nos dados históricos. O RMSE indica o erro médio em Reais.
@@ -103,8 +160,8 @@ with aba4:
     
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.subheader("Rede Neural LSTM")
-        previsao = previsao_lstm()
+        st.subheader("Rede Neural GRU")
+        previsao = previsao_lstm(preditores)
         st.metric(
             label="Próxima Previsão", 
             value=format_number(previsao, 'R$'))
@@ -114,7 +171,7 @@ with aba4:
         
     with col2:
         st.subheader("Rede Neural MLP")
-        previsao = previsao_mlp()
+        previsao = previsao_mlp(preditores)
         st.metric(
             label="Próxima Previsão", 
             value=format_number(previsao, 'R$'))
@@ -124,7 +181,7 @@ with aba4:
         
     with col3:
         st.subheader("Regressão Linear")
-        previsao = previsao_reg_linear()
+        previsao = previsao_reg_linear(preditores)
         st.metric(
             label="Próxima Previsão", 
             value=format_number(previsao, 'R$'))
@@ -134,7 +191,7 @@ with aba4:
     
     with st.expander("📚 Sobre os modelos"):
         st.markdown("""
-        - **LSTM**: Rede neural especializada em séries temporais
+        - **GRU**: Rede neural recorrente especializada em séries temporais
         - **MLP**: Rede neural tradicional para problemas genéricos
         - **Regressão Linear**: Modelo estatístico básico como referência
         """)
@@ -144,27 +201,11 @@ with aba5:
     st.header("Comparação de Desempenho dos Modelos")
     
     # Dados para o gráfico
-    modelos = ['LSTM', 'MLP', 'Regressão Linear']
+    modelos = ['GRU', 'MLP', 'Regressão Linear']
     erros = [rmse_lstm_reais, rmse_mlp_reais, rmse_lr_reais]
     
-    # Criando o gráfico de barras
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=modelos,
-        y=erros,
-        text=[f'R${erro:.2f}' for erro in erros],
-        textposition='auto',
-        marker_color=['#636EFA', '#EF553B', '#00CC96']
-    ))
-    
-    fig.update_layout(
-        title='Erro Médio (RMSE) em Reais',
-        xaxis_title='Modelos',
-        yaxis_title='Erro Médio (R$)',
-        template='plotly_white'
-    )
-    
-    st.plotly_chart(fig, use_container_width=True)
+    # Gráfico de barras (montado uma vez, os erros não mudam em execução)
+    st.plotly_chart(bar_fig(tuple(erros), tuple(modelos)), use_container_width=True)
     
     # Análise comparativa
     melhor_modelo = modelos[np.argmin(erros)]
@@ -1,73 +1,301 @@
+import hashlib
+import os
+import platform
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import joblib
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_squared_error
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, LSTM
-from dataset import df
+from numpy.lib.stride_tricks import sliding_window_view
+import tensorflow as tf
+from tensorflow.lite.python.convert_phase import ConverterError
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import Dense, GRU
 
 # ----- PREPARAÇÃO DOS DADOS -----
-dados = df[['Preco_R$']].values
-scaler = MinMaxScaler()
-dados_scaled = scaler.fit_transform(dados)
-
 window = 10
-X, y = [], []
-for i in range(window, len(dados_scaled)):
-    X.append(dados_scaled[i-window:i, 0])
-    y.append(dados_scaled[i, 0])
-X, y = np.array(X), np.array(y)
-X_lstm = X.reshape((X.shape[0], X.shape[1], 1))
-
-# ----- LSTM -----
-model_lstm = Sequential([
-    LSTM(50, activation='relu', input_shape=(X_lstm.shape[1], 1)),
-    Dense(1)
-])
-model_lstm.compile(optimizer='adam', loss='mse')
-model_lstm.fit(X_lstm, y, epochs=10, batch_size=16, verbose=0)
-
-# Previsão e cálculo do MSE em R$
-y_pred_lstm = model_lstm.predict(X_lstm, verbose=0)
-y_pred_lstm_original = scaler.inverse_transform(y_pred_lstm)
-y_original = scaler.inverse_transform(y.reshape(-1, 1))
-mse_lstm_reais = mean_squared_error(y_original, y_pred_lstm_original)
-rmse_lstm_reais = np.sqrt(mse_lstm_reais)
-
-def previsao_lstm():
-    entrada = dados_scaled[-window:].reshape((1, window, 1))
-    pred = model_lstm.predict(entrada, verbose=0)
-    return scaler.inverse_transform(pred)[0][0]
-
-# ----- MLP -----
-model_mlp = Sequential([
-    Dense(64, activation='relu', input_shape=(window,)),
-    Dense(32, activation='relu'),
-    Dense(1)
-])
-model_mlp.compile(optimizer='adam', loss='mse')
-model_mlp.fit(X, y, epochs=10, batch_size=16, verbose=0)
-
-y_pred_mlp = model_mlp.predict(X, verbose=0)
-y_pred_mlp_original = scaler.inverse_transform(y_pred_mlp)
-mse_mlp_reais = mean_squared_error(y_original, y_pred_mlp_original)
-rmse_mlp_reais = np.sqrt(mse_mlp_reais)
-
-def previsao_mlp():
-    entrada = dados_scaled[-window:].reshape((1, window))
-    pred = model_mlp.predict(entrada, verbose=0)
-    return scaler.inverse_transform(pred)[0][0]
-
-# ----- REGRESSÃO LINEAR -----
-model_lr = LinearRegression()
-model_lr.fit(X, y)
-
-y_pred_lr = model_lr.predict(X)
-y_pred_lr_original = scaler.inverse_transform(y_pred_lr.reshape(-1, 1))
-mse_lr_reais = mean_squared_error(y_original, y_pred_lr_original)
-rmse_lr_reais = np.sqrt(mse_lr_reais)
-
-def previsao_reg_linear():
-    entrada = dados_scaled[-window:].reshape((1, window))
-    pred = model_lr.predict(entrada)
-    return scaler.inverse_transform(pred.reshape(-1, 1))[0][0]
\ No newline at end of file
+
+# Lotes grandes e vários passos por chamada reduzem o custo fixo de cada passo do treino
+BATCH_TREINO = 128
+PASSOS_POR_EXECUCAO = 32
+
+# Pasta onde os modelos treinados ficam salvos entre execuções
+PASTA_MODELOS = 'modelos'
+# Incrementar quando a arquitetura ou o treino mudar, para descartar o cache antigo
+VERSAO_MODELOS = 6
+
+# Quantização dos modelos TFLite. Os kernels int8 do TFLite são otimizados para
+# ARM (NEON); em x86 eles costumam ser mais lentos que os de float ("quant kernels
+# haven't been optimized as much as those corresponding float kernels on Intel
+# CPUs"), então nesses processadores os pesos ficam em float16.
+QUANTIZACAO = 'int8' if platform.machine() in ('aarch64', 'arm64', 'armv7l') else 'float16'
+
+# Com GPU, treina em float16 (as camadas de saída continuam em float32)
+if tf.config.list_physical_devices('GPU'):
+    tf.keras.mixed_precision.set_global_policy('mixed_float16')
+
+
+def chave_dados(dados):
+    """
+    Gera um identificador dos dados para saber se os modelos salvos ainda valem.
+    """
+    return hashlib.sha1(dados.tobytes() + str(VERSAO_MODELOS).encode()).hexdigest()
+
+
+class RegressaoLinear:
+    """
+    Regressão linear com intercepto resolvida pelas equações normais.
+
+    O sistema é pequeno (window + 1 incógnitas), então é resolvido direto com
+    lstsq, que também aceita X^T X singular (por exemplo, série constante).
+    """
+    def __init__(self):
+        self.w = None
+
+    def fit(self, X, y):
+        Xb = np.hstack([X, np.ones((X.shape[0], 1))])
+        self.w = np.linalg.lstsq(Xb.T @ Xb, Xb.T @ y, rcond=None)[0]
+        return self
+
+    def predict(self, X):
+        return X @ self.w[:-1] + self.w[-1]
+
+
+def normalizar(dados, pmin, pmax):
+    """
+    Leva os preços para o intervalo [0, 1], a mesma conta do MinMaxScaler.
+    """
+    return ((dados - pmin) / ((pmax - pmin) or 1.0)).astype(np.float32)
+
+
+def rmse_reais(y, y_pred, pmin, pmax):
+    """
+    RMSE em Reais calculado na escala normalizada.
+
+    A normalização é afim, então basta multiplicar o erro por (pmax - pmin) em
+    vez de desnormalizar os dois vetores. O erro fica em float32, que basta para
+    um valor em Reais com duas casas.
+    """
+    erro = np.subtract(y, np.ravel(y_pred), dtype=np.float32)
+    np.square(erro, out=erro)
+    return np.sqrt(erro.mean()) * ((pmax - pmin) or 1.0)
+
+
+def dataset_treino(X, y):
+    """
+    Pipeline tf.data do treino: os tensores ficam em cache após a primeira época
+    e o próximo lote é preparado enquanto o atual é processado.
+    """
+    return (
+        tf.data.Dataset.from_tensor_slices((X, y))
+        .cache()
+        .shuffle(len(y))
+        .batch(min(BATCH_TREINO, len(y)))
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def treinar_modelos(dados):
+    """
+    Treina os três modelos e calcula o RMSE de cada um em Reais.
+    """
+    pmin, pmax = float(dados.min()), float(dados.max())
+    # O Keras trabalha em float32; converte uma vez só em vez de a cada fit/predict
+    dados_scaled = normalizar(dados, pmin, pmax)
+
+    # Janelas deslizantes como visão da série (sem copiar os dados).
+    # X (MLP/Regressão) e X_lstm compartilham o mesmo buffer de len(dados) floats.
+    flat = dados_scaled[:, 0]
+    X = sliding_window_view(flat[:-1], window)
+    y = flat[window:]
+    X_lstm = X[..., None]
+
+    # ----- GRU -----
+    # Camada GRU no lugar da LSTM: mesma capacidade com 3 portas em vez de 4
+    model_lstm = Sequential([
+        GRU(50, activation='relu', input_shape=(X_lstm.shape[1], 1)),
+        Dense(1, dtype='float32')
+    ])
+    model_lstm.compile(optimizer='adam', loss='mse', steps_per_execution=PASSOS_POR_EXECUCAO)
+    model_lstm.fit(dataset_treino(X_lstm, y), epochs=10, verbose=0)
+
+    # ----- MLP -----
+    model_mlp = Sequential([
+        Dense(64, activation='relu', input_shape=(window,)),
+        Dense(32, activation='relu'),
+        Dense(1, dtype='float32')
+    ])
+    model_mlp.compile(optimizer='adam', loss='mse', steps_per_execution=PASSOS_POR_EXECUCAO)
+    model_mlp.fit(dataset_treino(X, y), epochs=10, verbose=0)
+
+    # ----- REGRESSÃO LINEAR -----
+    model_lr = RegressaoLinear().fit(X, y)
+
+    # Previsão e cálculo do RMSE em R$: as duas redes rodam num único grafo
+    # compilado com XLA, sem o predict do Keras
+    @tf.function(jit_compile=True)
+    def prever_redes(x):
+        return model_lstm(x[..., None], training=False), model_mlp(x, training=False)
+
+    # O TF e o BLAS liberam o GIL, então o grafo das redes e a regressão
+    # rodam ao mesmo tempo em threads separadas
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futuro_redes = executor.submit(prever_redes, tf.constant(X))
+        futuro_lr = executor.submit(model_lr.predict, X)
+    y_pred_lstm, y_pred_mlp = (p.numpy() for p in futuro_redes.result())
+    y_pred_lr = futuro_lr.result()
+
+    rmse_lstm_reais = rmse_reais(y, y_pred_lstm, pmin, pmax)
+    rmse_mlp_reais = rmse_reais(y, y_pred_mlp, pmin, pmax)
+    rmse_lr_reais = rmse_reais(y, y_pred_lr, pmin, pmax)
+
+    return {
+        'lstm': model_lstm,
+        'mlp': model_mlp,
+        'lr': model_lr,
+        'pmin': pmin,
+        'pmax': pmax,
+        'rmse': (rmse_lstm_reais, rmse_mlp_reais, rmse_lr_reais),
+    }
+
+
+def converter_tflite(model, formato_entrada, amostras):
+    """
+    Converte o modelo Keras para TFLite quantizado (ver QUANTIZACAO), para a
+    previsão de uma amostra por vez.
+
+    As amostras (janelas normalizadas) calibram as faixas da quantização int8;
+    em float16 não são usadas e podem ser None. A calibração usa até 200
+    janelas espalhadas pela série inteira, incluindo a mais recente: os preços
+    de hoje estão bem acima dos do início da série, e calibrar só com as
+    primeiras janelas saturaria as faixas int8.
+    """
+    spec = tf.TensorSpec((1, *formato_entrada), tf.float32)
+    funcao = tf.function(lambda x: model(x, training=False)).get_concrete_function(spec)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([funcao], model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if QUANTIZACAO == 'int8':
+        indices = np.linspace(0, len(amostras) - 1, min(200, len(amostras)), dtype=int)
+
+        def representative_dataset():
+            for amostra in amostras[indices]:
+                yield [amostra.reshape((1, *formato_entrada))]
+        converter.representative_dataset = representative_dataset
+    else:
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def carregar_interpretador(caminho):
+    """
+    Abre o modelo TFLite e devolve o interpretador junto com a trava que
+    protege o seu uso.
+
+    Os modelos ficam num cache compartilhado por todas as sessões do Streamlit
+    (cada uma roda numa thread) e o interpretador não é thread-safe.
+    """
+    interpretador = tf.lite.Interpreter(model_path=caminho)
+    interpretador.allocate_tensors()
+    return interpretador, threading.Lock()
+
+
+def executar_tflite(interpretador, trava, entrada):
+    info_entrada = interpretador.get_input_details()[0]
+    info_saida = interpretador.get_output_details()[0]
+    # set_tensor/invoke/get_tensor usam os mesmos buffers: uma sessão por vez
+    with trava:
+        interpretador.set_tensor(info_entrada['index'], entrada.astype(info_entrada['dtype']))
+        interpretador.invoke()
+        return interpretador.get_tensor(info_saida['index'])
+
+
+def prever_rede(modelos, nome, entrada):
+    """
+    Previsão de uma amostra pela versão TFLite da rede ou, se a conversão não
+    foi possível, chamando o modelo Keras direto (sem o overhead do predict).
+    """
+    tflite = modelos.get(f'{nome}_tflite')
+    if tflite is not None:
+        interpretador, trava = tflite
+        return executar_tflite(interpretador, trava, entrada)
+    return modelos[nome](tf.constant(entrada, dtype=tf.float32), training=False).numpy()
+
+
+def carregar_modelos(dados):
+    """
+    Carrega os modelos salvos em disco para os dados informados ou treina do zero.
+
+    Os arquivos são nomeados pelo hash dos dados, então o treino só é refeito
+    quando o dataset muda. O cache em memória entre execuções fica no app.
+    """
+    chave = chave_dados(dados)
+    caminho_lstm = os.path.join(PASTA_MODELOS, f'lstm_{chave}.keras')
+    caminho_mlp = os.path.join(PASTA_MODELOS, f'mlp_{chave}.keras')
+    caminho_demais = os.path.join(PASTA_MODELOS, f'modelos_{chave}.joblib')
+
+    if all(os.path.exists(c) for c in (caminho_lstm, caminho_mlp, caminho_demais)):
+        model_lr, pmin, pmax, rmses = joblib.load(caminho_demais)
+        modelos = {
+            'lstm': load_model(caminho_lstm),
+            'mlp': load_model(caminho_mlp),
+            'lr': model_lr,
+            'pmin': pmin,
+            'pmax': pmax,
+            'rmse': rmses,
+        }
+    else:
+        modelos = treinar_modelos(dados)
+        os.makedirs(PASTA_MODELOS, exist_ok=True)
+        modelos['lstm'].save(caminho_lstm)
+        modelos['mlp'].save(caminho_mlp)
+        joblib.dump(
+            (modelos['lr'], modelos['pmin'], modelos['pmax'], modelos['rmse']),
+            caminho_demais)
+
+    # Versões TFLite usadas nas previsões da interface
+    for nome, formato in (('lstm', (window, 1)), ('mlp', (window,))):
+        caminho = os.path.join(PASTA_MODELOS, f'{nome}_{QUANTIZACAO}_{chave}.tflite')
+        if not os.path.exists(caminho):
+            amostras = None
+            if QUANTIZACAO == 'int8':
+                amostras = sliding_window_view(
+                    normalizar(dados[:-1, 0], modelos['pmin'], modelos['pmax']), window)
+            try:
+                modelo_tflite = converter_tflite(modelos[nome], formato, amostras)
+            except ConverterError as erro:
+                # Sem TFLite para esta rede: prever_rede usa o modelo Keras
+                warnings.warn(
+                    f'Conversão TFLite do modelo {nome} falhou; usando o Keras: {erro}')
+                continue
+            with open(caminho, 'wb') as file:
+                file.write(modelo_tflite)
+        modelos[f'{nome}_tflite'] = carregar_interpretador(caminho)
+
+    # Última janela normalizada, entrada de todas as previsões
+    modelos['entrada'] = normalizar(dados[-window:], modelos['pmin'], modelos['pmax'])
+    return modelos
+
+
+def desnormalizar(modelos, y):
+    """
+    Volta um valor normalizado para Reais.
+    """
+    return y * (modelos['pmax'] - modelos['pmin']) + modelos['pmin']
+
+
+def previsao_lstm(modelos):
+    entrada = modelos['entrada'].reshape((1, window, 1))
+    pred = prever_rede(modelos, 'lstm', entrada)
+    return desnormalizar(modelos, pred[0][0])
+
+
+def previsao_mlp(modelos):
+    entrada = modelos['entrada'].reshape((1, window))
+    pred = prever_rede(modelos, 'mlp', entrada)
+    return desnormalizar(modelos, pred[0][0])
+
+
+def previsao_reg_linear(modelos):
+    entrada = modelos['entrada'].reshape((1, window))
+    pred = modelos['lr'].predict(entrada)
+    return desnormalizar(modelos, pred[0])
\ No newline at end of file